@@ -1,4 +1,5 @@
 import asyncio
+import json
 import uuid
 from uritools import urisplit
 
@@ -53,6 +54,11 @@ class CephAdaptor(object):
         parts = o.path.split('/')
         size = self._allocation.size
         return ceph.read(parts[1], parts[2], size, loop, **kwds)
+
+    def read_into(self, buf, loop, **kwds):
+        o = urisplit(self._allocation.location)
+        parts = o.path.split('/')
+        return ceph.read_into(parts[1], parts[2], buf[:self._allocation.size], loop, **kwds)
     
     @trace.info("CephAdaptor")
     def copy(self, depot, src_kwds, dst_kwds, **kwargs):
@@ -736,6 +736,16 @@ class WriteOperation(Operation):
     def remove(self):
         self.librados.rados_write_op_remove(self.wop)
 
+    def copy_from(self, src: str, src_ioctx, src_version: int=0,
+                  src_fadvise_flags: Operation.OpFlags = Operation.OpFlags.none):
+        if not isinstance(src, str):
+            raise TypeError('src must be a string')
+        if not isinstance(src_fadvise_flags, Operation.OpFlags):
+            raise TypeError('src_fadvise_flags must be one of OperationOpFlags')
+
+        self.librados.rados_write_op_copy_from(self.wop, s2cs(src), src_ioctx.io,
+                                               c_uint64(src_version), src_fadvise_flags.value)
+
     def append(self, data: bytes):
         if not isinstance(data, bytes):
             raise TypeError('data must be a bytes')
@@ -937,6 +947,29 @@ returned %d, but should return zero on success." % (self.name, ret))
             raise make_ex(ret, "Ioctx.read(%s): failed to read %s" % (self.name, key))
         return ctypes.string_at(ret_buf, ret)
 
+    def read_into(self, key: str, buf, offset:int=0) -> int:
+        """
+        Read data from an object synchronously into a caller supplied buffer
+
+        :param key: name of the object
+        :param buf: writable buffer, at most len(buf) bytes are read
+        :param offset: byte offset in the object to begin reading at
+
+        :raises: :class:`TypeError`
+        :raises: :class:`Error`
+        :returns: int - number of bytes read
+        """
+        self.require_ioctx_open()
+        if not isinstance(key, str):
+            raise TypeError('key must be a string')
+        length = len(buf)
+        ret_buf = (c_char * length).from_buffer(buf)
+        ret = self.librados.rados_read(self.io, s2cs(key), ret_buf, c_size_t(length),
+                            c_uint64(offset))
+        if ret < 0:
+            raise make_ex(ret, "Ioctx.read_into(%s): failed to read %s" % (self.name, key))
+        return ret
+
     def get_stats(self):
         """
         Get pool usage statistics
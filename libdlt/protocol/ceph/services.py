@@ -1,6 +1,10 @@
 import asyncio
+import threading
+
+from functools import partial
 
 from libdlt.protocol.ceph.rados.core import Cluster
+from libdlt.settings import BLOCKSIZE
 
 from lace.logging import trace
 
@@ -8,45 +12,69 @@ class ProtocolService(object):
     @trace.debug("Ceph.ProtocolService")
     def __init__(self):
         self.cluster_cache = dict()
+        self._lock = threading.Lock()
         
-    @trace.debug("Ceph.ProtocolService")
-    async def _get_cluster(self, loop, **kwds):
+    def _get_cluster_sync(self, **kwds):
+        # copy runs on executor threads, connect at most once per config
         conf = kwds.get("config", '')
-        name = kwds.get("client_id", 'client.admin')
-        cname = kwds.get("clustername", None)
         cluster = self.cluster_cache.get(conf, None)
         if not cluster:
-            cluster = Cluster(conffile=conf, clustername=cname)
-            await loop.run_in_executor(None, cluster.connect)
-            self.cluster_cache[conf] = cluster
+            with self._lock:
+                cluster = self.cluster_cache.get(conf, None)
+                if not cluster:
+                    cluster = Cluster(conffile=conf, clustername=kwds.get("clustername", None))
+                    cluster.connect()
+                    self.cluster_cache[conf] = cluster
+        return cluster
+        
+    async def _get_cluster(self, loop, **kwds):
+        # concurrent misses share the locked accessor, one connect per config
+        cluster = self.cluster_cache.get(kwds.get("config", ''), None)
+        if not cluster:
+            cluster = await loop.run_in_executor(kwds.get("executor"), partial(self._get_cluster_sync, **kwds))
         return cluster
         
     @trace.info("Ceph.ProtocolService")
     def copy(self, p, src_oid, dst_oid, size, src_kwds, dst_kwds):
-        src_cluster = self._get_cluster(**src_kwds)
-        dst_cluster = self._get_cluster(**dst_kwds)
-        ioctx = src_cluster.open_ioctx(p)
-        data = ioctx.read(src_oid, size)
-        
-        ioctx.close()
-        
+        src_cluster = self._get_cluster_sync(**src_kwds)
+        dst_cluster = self._get_cluster_sync(**dst_kwds)
         pool = dst_kwds.get("pool", "dlt")
-        ioctx = dst_cluster.open_ioctx(pool)
-        ioctx.write_full(dst_oid, data)
-        ioctx.close()
+        src_ioctx = src_cluster.open_ioctx(p)
+        dst_ioctx = dst_cluster.open_ioctx(pool)
+        try:
+            if src_cluster is dst_cluster:
+                # Same cluster, the OSDs move the object without touching the client
+                op = dst_ioctx.write_op_create()
+                op.copy_from(src_oid, src_ioctx)
+                dst_ioctx.write_op_operate(dst_oid, op)
+            else:
+                # write_full creates the object, even when it is empty
+                data = src_ioctx.read(src_oid, min(BLOCKSIZE, size), 0) if size else b""
+                dst_ioctx.write_full(dst_oid, data)
+                for offset in range(BLOCKSIZE, size, BLOCKSIZE):
+                    data = src_ioctx.read(src_oid, min(BLOCKSIZE, size - offset), offset)
+                    dst_ioctx.write(dst_oid, data, offset)
+        finally:
+            src_ioctx.close()
+            dst_ioctx.close()
     
-    @trace.info("Ceph.ProtocolService")
     async def write(self, oid, data, loop, **kwds):
         cluster = await self._get_cluster(loop, **kwds)
         pool = kwds.get("pool", "dlt")
         ioctx = cluster.open_ioctx(pool)
-        await loop.run_in_executor(None, ioctx.write_full, oid, data)
+        await loop.run_in_executor(kwds.get("executor"), ioctx.write_full, oid, data)
         ioctx.close()
         
-    @trace.info("Ceph.ProtocolService")
     async def read(self, p, oid, size, loop, **kwds):
         cluster = await self._get_cluster(loop, **kwds)
         ioctx = cluster.open_ioctx(p)
-        ret = await loop.run_in_executor(None, ioctx.read, oid, size)
+        ret = await loop.run_in_executor(kwds.get("executor"), ioctx.read, oid, size)
+        ioctx.close()
+        return ret
+
+    async def read_into(self, p, oid, buf, loop, **kwds):
+        cluster = await self._get_cluster(loop, **kwds)
+        ioctx = cluster.open_ioctx(p)
+        ret = await loop.run_in_executor(kwds.get("executor"), ioctx.read_into, oid, buf)
         ioctx.close()
         return ret
@@ -1,5 +1,3 @@
-import json
-
 import libdlt.protocol.ibp.factory as ibp
 import libdlt.protocol.ceph.factory as ceph
 #import libdlt.protocol.rdma.factory as rdma
@@ -7,6 +5,7 @@ import libdlt.protocol.ceph.factory as ceph
 
 from lace import logging
 from lace.logging import trace
+from libdlt.util.util import loads
 from libdlt.protocol.ibp.allocation import IBP_EXTENT_URI
 from libdlt.protocol.ceph.allocation import CEPH_EXTENT_URI
 #from libdlt.protocol.rdma.allocation import RDMA_EXTENT_URI
@@ -29,19 +28,20 @@ SCHEMA_MAP = {
 }
 
 @trace.info("factory")
-def buildAllocation(json):
-    if type(json) is str:
+def buildAllocation(src):
+    if isinstance(src, Extent):
+        return SCHEMA_MAP[getattr(src, "$schema")].buildAllocation(src)
+    if type(src) is str:
         try:
-            json = json.loads(json)
+            src = loads(src)
         except Exception as exp:
             logging.getLogger().warn("{func:>20}| Could not decode allocation - {exp}".format(func = "buildAllocation", exp = exp))
             return False
+    return buildAllocationFromDict(src)
 
-    if isinstance(json, Extent):
-        schema = getattr(json, "$schema")
-    else:
-        schema = json["schema"]
-    return SCHEMA_MAP[schema].buildAllocation(json)
+def buildAllocationFromDict(src):
+    schema = src["$schema"] if "$schema" in src else src["schema"]
+    return SCHEMA_MAP[schema].buildAllocation(src)
 
 @trace.info("factory")
 def makeAllocation(data, offset, depot, **kwds):
@@ -14,18 +14,18 @@ from unis.models import Extent
 
 # construct adaptor from existing metadata
 @trace.info("IBP.factory")
-def buildAllocation(json):
-    if type(json) is str:
+def buildAllocation(src):
+    if type(src) is str:
         try:
-            json = json.loads(json)
+            src = json.loads(src)
         except Exception as exp:
-            logger.warn("{func:>20}| Could not decode allocation - {exp}".format(func = "buildAllocation", exp = exp))
+            logging.getLogger().warn("{func:>20}| Could not decode allocation - {exp}".format(func = "buildAllocation", exp = exp))
             raise AllocationError("Could not decode json")
 
-    if isinstance(json, IBPExtent):
-        alloc = json
-    elif isinstance(json, dict):
-        alloc = IBPExtent(json)
+    if isinstance(src, IBPExtent):
+        alloc = src
+    elif isinstance(src, dict):
+        alloc = IBPExtent(src)
     else:
         raise AllocationError("Invalid input type")
     
@@ -114,8 +114,9 @@ class IBPAdaptor(object):
         if not duration:
             return False
         
-        dest_alloc._allocation.start = datetime.datetime.utcnow()
-        dest_alloc._allocation.end = datetime.datetime.utcnow() + datetime.timedelta(seconds = duration)
+        now = datetime.datetime.utcnow()
+        dest_alloc._allocation.start = now
+        dest_alloc._allocation.end = now + datetime.timedelta(seconds = duration)
         
         return dest_alloc
         
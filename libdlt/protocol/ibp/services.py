@@ -10,6 +10,7 @@ to the IBP protocol
 
 '''
 
+import re
 import time
 import argparse
 import socket
@@ -25,17 +26,19 @@ from libdlt.protocol.ibp import flags, allocation
 from libdlt.protocol.ibp.flags import print_error
 from libdlt.protocol.ibp.exceptions import IBPError
 
+# ibp://<host>:<port>/<key>/<wrmKey>/<code>
+_CAP_RE = re.compile(r"[^/]*/[^/]*/[^/]*/(?P<key>[^/]*)/(?P<wrm>[^/]*)/(?P<code>[^/]*)")
+
 class Capability(object):
     def __init__(self, cap_string):
         try:
-            self._cap       = cap_string
-            tmpSplit        = cap_string.split("/")
-            tmpAddress      = tmpSplit[2].split(":")
-            self.key        = tmpSplit[3]
-            self.wrmKey     = tmpSplit[4]
-            self.code       = tmpSplit[5]
+            m = _CAP_RE.match(cap_string)
         except Exception as exp:
             raise ValueError('Malformed capability string')
+        if not m:
+            raise ValueError('Malformed capability string')
+        self._cap = cap_string
+        self.key, self.wrmKey, self.code = m.group('key', 'wrm', 'code')
 
     def __str__(self):
         return self._cap
@@ -214,8 +217,9 @@ class ProtocolService(object):
             alloc = allocation.IBPExtent()
             for i, prop in enumerate(['read', 'write', 'manage']):
                 setattr(alloc.mapping, prop, result[i].replace("ibp://0.0.0.0", "ibp://" + depot.host))
-            alloc.lifetime = { 'start': str(int(time.time() * 1000000)),
-                               'end':  str(int((time.time() + duration) * 1000000)) }
+            now = time.time()
+            alloc.lifetime = { 'start': str(int(now * 1000000)),
+                               'end':  str(int((now + duration) * 1000000)) }
             
             alloc.depot = depot
             alloc.location = depot.endpoint
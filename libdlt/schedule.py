@@ -1,5 +1,7 @@
 import abc
 
+from array import array
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
 from itertools import cycle
 from lace.logging import trace
@@ -26,50 +28,82 @@ class AbstractSchedule(metaclass=abc.ABCMeta):
         offset.
         """
         pass
+
+    def release(self, offset, value):
+        """
+        release returns a value emitted by get for offset
+        that could not be used, such as a depot that failed
+        to allocate, so it may be offered again.
+        """
+        pass
     
 
 class BaseUploadSchedule(AbstractSchedule):
     @trace.info("BaseUploadSchedule")
     def setSource(self, source):
         self._depots = source
-        self._ls = cycle(source.keys())
         self._copies = defaultdict(list)
+        self.refresh()
 
     @trace.info("BaseUploadSchedule")
+    def refresh(self):
+        """
+        Rebuilds the depot ring from the currently enabled
+        depots, call when depot health changes.
+        """
+        self._enabled = [k for k, v in self._depots.items() if v.enabled]
+        self._ls = cycle(self._enabled)
+
     def get(self, context={}):
-        for depot in self._ls:
-            if depot in self._copies[context.get('offset', None)]:
-                continue
-            if self._depots[depot].enabled:
-                self._copies[context.get('offset', '<none>')].append(depot)
+        offset = context.get('offset', None)
+        copies = self._copies[offset] if offset is not None else []
+        for _ in range(len(self._enabled)):
+            depot = next(self._ls)
+            if depot not in copies:
+                copies.append(depot)
                 return depot
+        raise IndexError("No enabled depots fulfill request: offset ~ {}".format(offset))
+
+    def release(self, offset, depot):
+        copies = self._copies.get(offset, [])
+        if depot in copies:
+            copies.remove(depot)
 
 class BaseDownloadSchedule(AbstractSchedule):
     @trace.info("BaseDownloadSchedule")
     def setSource(self, source):
-        chunks = defaultdict(list)
-        for ext in source:
-            chunks[ext.offset].append({"retry": 0, "alloc": ext})
-        self._ls = chunks
+        # Parallel arrays ordered by extent offset
+        exts = sorted(((ext.offset, ext.size, ext) for ext in source), key=lambda x: x[0])
+        self._starts = array('q', (start for start, _, _ in exts))
+        self._ends = array('q', (start + size for start, size, _ in exts))
+        self._retry = array('i', [0]) * len(exts)
+        self._live = bytearray(b'\x01' * len(exts))
+        self._allocs = [ext for _, _, ext in exts]
+        self._maxsize = max((size for _, size, _ in exts), default=0)
         
-    @trace.info("BaseDownloadSchedule")
     def get(self, context={}):
         offset = context["offset"]
-        if offset in self._ls and self._ls[offset]:
-            chunk = self._ls[offset].pop()
-            if chunk['retry'] < DOWNLOAD_RETRY:
-                chunk['retry'] += 1
-                self._ls[offset].insert(0, chunk)
-            return chunk['alloc']
-        else:
-            chunk = None
-            for k, chunk in self._ls.items():
-                if k < offset:
-                    for i, ext in enumerate(chunk):
-                        if ext['alloc'].size + ext['alloc'].offset > offset:
-                            chunk = self._ls[k].pop(i)
-                            if chunk['retry'] < DOWNLOAD_RETRY:
-                                chunk['retry'] += 1
-                                self._ls[k].insert(0, chunk)
-                            return ext['alloc']
+        lo, hi = bisect_left(self._starts, offset), bisect_right(self._starts, offset)
+        
+        # Rotate through replicas starting at offset, least retried first
+        best = None
+        for i in range(lo, hi):
+            if self._live[i] and (best is None or self._retry[i] < self._retry[best]):
+                best = i
+        
+        # Otherwise find the nearest extent starting before offset that covers it
+        if best is None:
+            for i in range(lo - 1, -1, -1):
+                if self._starts[i] + self._maxsize <= offset:
+                    break
+                if self._live[i] and self._ends[i] > offset:
+                    best = i
+                    break
+        if best is None:
             raise IndexError("No more allocations fulfill request: offset ~ {}".format(offset))
+        
+        if self._retry[best] < DOWNLOAD_RETRY:
+            self._retry[best] += 1
+        else:
+            self._live[best] = 0
+        return self._allocs[best]
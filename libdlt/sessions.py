@@ -8,7 +8,7 @@ import types
 import uuid
 
 from functools import partial
-from itertools import cycle
+from itertools import cycle, islice
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from uritools import urisplit
 from socketIO_client import SocketIO
@@ -21,12 +21,15 @@ from libdlt.depot import Depot
 from libdlt.protocol import factory
 from libdlt.protocol.exceptions import AllocationError
 from libdlt.schedule import BaseDownloadSchedule, BaseUploadSchedule
-from libdlt.settings import DEPOT_TYPES, THREADS, COPIES, BLOCKSIZE, TIMEOUT
+from libdlt.settings import DEPOT_TYPES, THREADS, COPIES, BLOCKSIZE, TIMEOUT, BATCH_SIZE, BATCH_BYTES
 from libdlt.result import UploadResult, DownloadResult, CopyResult
 from unis.models import Exnode, Service
 from unis.runtime import Runtime
 from unis.utils.asynchronous import make_async
 
+# blocks coalesced into one pwritev, well under the platform IOV_MAX
+WRITE_BATCH = 64
+
 class Session(object):
     __WS_MTYPE = {
         'r' : 'peri_download_register',
@@ -56,8 +59,11 @@ class Session(object):
         self._plan = cycle
         self._depots = {}
         self._threads = threads
+        self._batch = max(1, min(kwargs.get("batch_size", BATCH_SIZE), BATCH_BYTES // self._blocksize))
         self._viz = kwargs.get("viz_url", None)
+        self._viz_sockets = {}
         self._jobs = asyncio.Queue()
+        self._io_pool = ThreadPoolExecutor(max_workers=max(self._threads * 4, 32), thread_name_prefix="dlt-io")
         self.log = logging.getLogger('libdlt')
         self._record = []
         
@@ -77,6 +83,7 @@ class Session(object):
 
         if not len(self._depots):
             raise ValueError("No depots found for session, unable to continue")
+        self._depot_json = {ep: depot.to_JSON() for ep, depot in self._depots.items()}
 
     def get_record(self):
         return self._record
@@ -84,10 +91,14 @@ class Session(object):
     @trace.debug("Session")
     def _viz_register(self, name, size, conns):
         if self._viz:
+            key = None
             try:
                 uid = uuid.uuid4().hex
                 o = urisplit(self._viz)
-                sock = SocketIO(o.host, o.port)
+                key = (o.host, o.port)
+                if key not in self._viz_sockets:
+                    self._viz_sockets[key] = SocketIO(o.host, o.port)
+                sock = self._viz_sockets[key]
                 msg = {"sessionId": uid,
                        "filename": name,
                        "size": size,
@@ -98,9 +109,15 @@ class Session(object):
                 return uid, sock, name, size
             except Exception as e:
                 self.log.warn(e)
+                # drop a dead socket so the next transfer reconnects
+                sock = self._viz_sockets.pop(key, None)
+                if sock:
+                    try:
+                        sock.disconnect()
+                    except Exception:
+                        pass
         return None
             
-    @trace.debug("Session")
     def _viz_progress(self, sock, depot, size, offset, cb):
         try:
             d = Depot(depot)
@@ -125,46 +142,74 @@ class Session(object):
         for chunk in range(0, size, step):
             for _ in range(copies):
                 self._jobs.put_nowait((chunk, step))
+
+    def _drain_batch(self, n):
+        # Lazily pop up to n jobs, callers may requeue work between pulls
+        while n and not self._jobs.empty():
+            n -= 1
+            yield self._jobs.get_nowait()
+
+    def _contiguous(self, jobs):
+        run, end = [], 0
+        for offset, size in sorted(jobs):
+            if run and offset > end:
+                yield run
+                run, end = [], 0
+            run.append((offset, size))
+            end = max(end, offset + size)
+        if run:
+            yield run
     
     @trace.debug("Session")
-    async def _upload_chunks(self, path, schedule, duration, sock, rank, progress_cb):
+    async def _upload_chunks(self, fd, schedule, duration, sock, rank, progress_cb):
+        loop = asyncio.get_running_loop()
         uploaded = 0
         allocs = []
-        with open(path, 'rb') as fh:
-            while not self._jobs.empty():
-                offset, size = await self._jobs.get()
-                fh.seek(offset)
-                data = await asyncio.get_event_loop().run_in_executor(None, fh.read, size)
-                rsize = len(data)
+        while not self._jobs.empty():
+            for run in self._contiguous(self._drain_batch(self._batch)):
+                ## Read contiguous range ##
+                start = run[0][0]
+                length = max(o + s for o, s in run) - start
+                buf = await loop.run_in_executor(self._io_pool, os.pread, fd, length, start)
                 
-                ## Upload chunk ##
-                try:
-                    d = Depot(schedule.get({"offset": offset, "size": len(data), "data": data}))
-                except Exception as exp:
-                    self.log.warn("Failed to schedule chunk upload - {}".format(exp))
-                    continue
-                try:
+                ## Upload chunks ##
+                pending = []
+                for offset, size in run:
+                    data = buf[offset - start:offset - start + size]
+                    try:
+                        depot = schedule.get({"offset": offset, "size": len(data), "data": data})
+                    except Exception as exp:
+                        # a missing chunk would corrupt the exnode, abort the upload
+                        self.log.error("Failed to schedule chunk upload - {}".format(exp))
+                        raise
+                    d = Depot(depot)
                     fn = partial(factory.makeAllocation, **{**{'duration': duration},
-                                                            **self._depots[d.endpoint].to_JSON()})
-                    alloc = await asyncio.get_event_loop().run_in_executor(None, fn, data, offset, d)
-                except AllocationError:
-                    self._jobs.put_nowait((offset, size))
-                    continue
+                                                            **self._depot_json[d.endpoint]})
+                    fut = loop.run_in_executor(self._io_pool, fn, data, offset, d)
+                    pending.append((offset, size, len(data), depot, fut))
+                results = await asyncio.gather(*[p[4] for p in pending], return_exceptions=True)
                 
-                ## Create Allocation ##
-                alloc = alloc.getMetadata()
-                self._record.append(('U', alloc, offset, rsize))
-                self._viz_progress(sock, alloc.location, alloc.size, alloc.offset, progress_cb)
-                self.log.info("[{}] Uploaded: {}-{}".format(rank, offset, offset+rsize))
-                allocs.append(alloc)
-                uploaded += len(data)
+                ## Create Allocations ##
+                for (offset, size, rsize, depot, _), alloc in zip(pending, results):
+                    if isinstance(alloc, AllocationError):
+                        schedule.release(offset, depot)
+                        self._jobs.put_nowait((offset, size))
+                        continue
+                    elif isinstance(alloc, Exception):
+                        raise alloc
+                    alloc = alloc.getMetadata()
+                    self._record.append(('U', alloc, offset, rsize))
+                    self._viz_progress(sock, alloc.location, alloc.size, alloc.offset, progress_cb)
+                    self.log.info("[{}] Uploaded: {}-{}".format(rank, offset, offset+rsize))
+                    allocs.append(alloc)
+                    uploaded += rsize
 
         return (uploaded, allocs)
         
     @trace.info("Session")
     def upload(self, path, filename=None, folder=None, copies=COPIES, duration=None, schedule=None, progress_cb=None):
-        async def _awrapper(schedule, sock):
-            workers = [self._upload_chunks(path, schedule, duration, sock, r, progress_cb) for r in range(self._threads)]
+        async def _awrapper(fd, schedule, sock):
+            workers = [self._upload_chunks(fd, schedule, duration, sock, r, progress_cb) for r in range(self._threads)]
             result = await asyncio.gather(*workers)
             return result
         
@@ -195,18 +240,25 @@ class Session(object):
         all_allocs = []
         ## Generate tasks ##
         self._generate_jobs(self._blocksize, ex.size, copies)
-        for upsize, allocs in make_async(_awrapper, schedule, sock):
-            uploaded += upsize
-            all_allocs.extend(allocs)
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            for upsize, allocs in make_async(_awrapper, fd, schedule, sock):
+                uploaded += upsize
+                all_allocs.extend(allocs)
+        finally:
+            os.close(fd)
         
         time_e = time.time()
         self._runtime.insert(ex, commit=True)
+        append = ex.extents.append
+        insert = self._runtime.insert
         for alloc in all_allocs:
-            alloc.parent = ex
-            alloc.getObject().__dict__['selfRef'] = ''
-            del alloc.getObject().__dict__['function']
-            ex.extents.append(alloc)
-            self._runtime.insert(alloc, commit=True)
+            d = alloc.getObject().__dict__
+            d.pop('function', None)
+            d['selfRef'] = ''
+            d['parent'] = ex
+            append(alloc)
+            insert(alloc, commit=True)
 
         if self._do_flush:
             self._runtime.flush()
@@ -214,81 +266,122 @@ class Session(object):
         return UploadResult(time_e - time_s, uploaded, ex)
     
     
+    def _pwritev_all(self, fd, bufs, offset):
+        # pwritev may stop short, resume after the bytes already written
+        total, done = sum(len(b) for b in bufs), os.pwritev(fd, bufs, offset)
+        while done < total:
+            skip, rest = done, []
+            for b in bufs:
+                if skip >= len(b):
+                    skip -= len(b)
+                    continue
+                rest.append(memoryview(b)[skip:])
+                skip = 0
+            n = os.pwritev(fd, rest, offset + done)
+            if not n:
+                raise OSError("Short write at offset {}".format(offset + done))
+            done += n
+        return done
+    
+    def _write_blocks(self, fd, blocks):
+        # Contiguous blocks are written with a single pwritev per run
+        written, run, start, end = 0, [], 0, 0
+        for offset, data in sorted(blocks, key=lambda x: x[0]):
+            if run and (offset != end or len(run) == WRITE_BATCH):
+                written += self._pwritev_all(fd, run, start)
+                run = []
+            if not run:
+                start = end = offset
+            run.append(data)
+            end += len(data)
+        if run:
+            written += self._pwritev_all(fd, run, start)
+        return written
+    
+    async def _read_into(self, service, buf, loop, **kwds):
+        # Reuse the worker's buffer, the data is consumed by pwrite before the next batch
+        return buf[:await service.read_into(buf, loop, **kwds)]
+    
     @trace.debug("Session")
-    async def _download_chunks(self, filepath, schedule, sock, rank, progress_cb):
-        def _write(fh, offset, data):
-            async def _noop():
-                return 0
-            fh.seek(offset)
-            if data:
-                return asyncio.get_event_loop().run_in_executor(None, fh.write, data)
-            return _noop()
-        fh = open(filepath, 'wb')
+    async def _download_chunks(self, fd, schedule, sock, rank, progress_cb):
+        loop = asyncio.get_running_loop()
         downloaded = 0
+        bufs = []
         while not self._jobs.empty():
-            offset, end = self._jobs.get_nowait()
-            try:
-                alloc = schedule.get({"offset": offset})
-            except IndexError as exp:
-                self.log.warn(exp)
-                continue
-            if alloc.offset + alloc.size < end:
-                await self._jobs.put((offset + alloc.size, end))
+            batch = []
+            for offset, end in self._drain_batch(self._batch):
+                try:
+                    alloc = schedule.get({"offset": offset})
+                except IndexError as exp:
+                    self.log.warn(exp)
+                    continue
+                if alloc.offset + alloc.size < end:
+                    self._jobs.put_nowait((offset + alloc.size, end))
+                batch.append((offset, alloc))
             
-            ## Download chunk ##
-            d = Depot(alloc.location)
-            service = factory.buildAllocation(alloc)
-            loop = asyncio.get_event_loop()
-            try:
-                fn = partial(service.read, **self._depots[d.endpoint].to_JSON())
-                data = await loop.run_in_executor(None, fn)
-            except AllocationError as exp:
-                self.log.warn("Unable to download block - {}".format(exp))
-                await self._jobs.put((offset, offset + alloc.size))
-                continue
-            if data:
-                self._record.append(('D', alloc, offset, len(data)))
-                self.log.info("[{}] Downloaded: {}-{}".format(rank, offset, offset+len(data)))
-                self._viz_progress(sock, alloc.location, alloc.size, alloc.offset, progress_cb)
-                length = await _write(fh, alloc.offset, data)
-                downloaded += length
-            else:
-                await self._jobs.put((offset, offset + alloc.size))
+            ## Download chunks ##
+            reads = []
+            for i, (offset, alloc) in enumerate(batch):
+                d = Depot(alloc.location)
+                service = factory.buildAllocation(alloc)
+                if hasattr(service, "read_into"):
+                    if i == len(bufs):
+                        bufs.append(bytearray(alloc.size))
+                    elif len(bufs[i]) < alloc.size:
+                        bufs[i] = bytearray(alloc.size)
+                    reads.append(self._read_into(service, memoryview(bufs[i]), loop,
+                                                 executor=self._io_pool, **self._depot_json[d.endpoint]))
+                else:
+                    fn = partial(service.read, **self._depot_json[d.endpoint])
+                    reads.append(loop.run_in_executor(self._io_pool, fn))
+            results = await asyncio.gather(*reads, return_exceptions=True)
+            
+            blocks = []
+            for (offset, alloc), data in zip(batch, results):
+                if isinstance(data, AllocationError):
+                    self.log.warn("Unable to download block - {}".format(data))
+                    self._jobs.put_nowait((offset, offset + alloc.size))
+                    continue
+                elif isinstance(data, Exception):
+                    raise data
+                if data:
+                    self._record.append(('D', alloc, offset, len(data)))
+                    self.log.info("[{}] Downloaded: {}-{}".format(rank, offset, offset+len(data)))
+                    self._viz_progress(sock, alloc.location, alloc.size, alloc.offset, progress_cb)
+                    blocks.append((alloc.offset, data))
+                else:
+                    self._jobs.put_nowait((offset, offset + alloc.size))
+            if blocks:
+                downloaded += await loop.run_in_executor(self._io_pool, self._write_blocks, fd, blocks)
         
-        fh.close()
         return downloaded
         
     @trace.info("Session")
     def download(self, href, folder=None, length=0, offset=0, schedule=None, progress_cb=None, filename=None):
-        async def _awrapper(folder, schedule, sock):
-            workers = [self._download_chunks(folder, schedule, sock, r, progress_cb) for r in range(self._threads)]
+        async def _awrapper(fd, schedule, sock):
+            workers = [self._download_chunks(fd, schedule, sock, r, progress_cb) for r in range(self._threads)]
             return await asyncio.gather(*workers)
 
         schedule = schedule or BaseDownloadSchedule()
         ex = next(self._runtime.exnodes.where({'selfRef': href}))
         allocs = ex.extents
         schedule.setSource(allocs)
-        locs = {}
-        
-        # bin extents and locations
-        for alloc in allocs:
-            if alloc.location not in locs:
-                locs[alloc.location] = []
-            locs[alloc.location].append(alloc)
+        n_locs = len({alloc.location for alloc in allocs})
         
         if not folder:
             folder = filename or ex.name
             
         # register download with Periscope
-        sock = self._viz_register(ex.name, ex.size, len(locs))
+        sock = self._viz_register(ex.name, ex.size, n_locs)
         
         time_s = time.time()
         self._jobs.put_nowait((0, ex.size))
-        if self._threads > 1:
-            downloaded = sum(make_async(_awrapper, folder, schedule, sock))
-        else:
-            offset = 0
-            with open(folder, 'wb') as fh:
+        fd = os.open(folder, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if self._threads > 1:
+                downloaded = sum(make_async(_awrapper, fd, schedule, sock))
+            else:
+                offset, pending, pending_size, downloaded = 0, [], 0, 0
                 while offset < ex.size:
                     try:
                         alloc = schedule.get({"offset": offset})
@@ -298,17 +391,23 @@ class Session(object):
                     d = Depot(alloc.location)
                     service = factory.buildAllocation(alloc)
                     try:
-                        data = service.read(**self._depots[d.endpoint].to_JSON())
+                        data = service.read(**self._depot_json[d.endpoint])
                     except AllocationError as exp:
                         self.log.warn("Unable to download block - {}".format(exp))
                         continue
                     if data:
                         self.log.info("Downloaded: {}-{}".format(offset, offset+len(data)))
                         self._viz_progress(sock, alloc.location, alloc.size, alloc.offset, progress_cb)
-                        fh.seek(alloc.offset)
-                        length = fh.write(data)
-                        offset += length
-            downloaded = offset
+                        pending.append((alloc.offset, data))
+                        pending_size += len(data)
+                        offset += len(data)
+                        if len(pending) >= WRITE_BATCH or pending_size >= 4 * self._blocksize:
+                            downloaded += self._write_blocks(fd, pending)
+                            pending, pending_size = [], 0
+                if pending:
+                    downloaded += self._write_blocks(fd, pending)
+        finally:
+            os.close(fd)
         
         return DownloadResult(time.time() - time_s, downloaded, ex)
         
@@ -326,35 +425,44 @@ class Session(object):
                     alloc = factory.buildAllocation(ext)
                     src_desc = Depot(ext.location)
                     dest_desc = Depot(upload_schedule.get({"offset": ext.offset, "size": ext.size}))
-                    src_depot = self._depots[src_desc.endpoint]
-                    dest_depot = self._depots[dest_desc.endpoint]
-                    dst_alloc = alloc.copy(dest_desc, src_depot.to_JSON(), dest_depot.to_JSON(), **kwargs)
+                    src_depot = self._depot_json[src_desc.endpoint]
+                    dest_depot = self._depot_json[dest_desc.endpoint]
+                    dst_alloc = alloc.copy(dest_desc, src_depot, dest_depot, **kwargs)
                     dst_ext = dst_alloc.getMetadata()
-                    self._viz_progress(sock_down, name, size, ext.location, ext.size, ext.offset, progress_cb)
-                    self._viz_progress(sock_up, name, size, dst_ext.location, dst_ext.size, dst_ext.offset, progress_cb)
+                    self._viz_progress(sock_down, ext.location, ext.size, ext.offset, progress_cb)
+                    self._viz_progress(sock_up, dst_ext.location, dst_ext.size, dst_ext.offset, progress_cb)
                     return (ext, dst_ext)
                 except Exception as exp:
                     self.log.warn ("READ Error: {}".format(exp))
                 return ext, False
             return _f
         
+        kwargs = {'duration': duration} if duration else {}
         ex = next(self._runtime.exnodes.where({'selfRef': href}))
         allocs = ex.extents
-        futures = []
         download_schedule.setSource(allocs)
         upload_schedule.setSource(self._depots)
         
         sock_up = self._viz_register("{}_upload".format(ex.name), ex.size, len(self._depots))
         sock_down = self._viz_register("{}_download".format(ex.name), ex.size, len(self._depots))
         copied = 0
+        window = 2 * self._threads
         time_s = time.time()
         with ThreadPoolExecutor(max_workers=self._threads) as executor:
-            for src_alloc, dst_alloc  in executor.map(_copy_chunk(sock_down, sock_up), offsets(ex.size)):
-                alloc = dst_alloc
-                self._runtime.insert(alloc, commit=True)
-                alloc.parent = ex
-                ex.extents.append(alloc)
-                copied += alloc.size
+            fn = _copy_chunk(ex.name, ex.size, sock_down, sock_up)
+            exts = offsets(ex.size)
+            futs = {executor.submit(fn, ext) for ext in islice(exts, window)}
+            while futs:
+                done, futs = concurrent.futures.wait(futs, return_when=concurrent.futures.FIRST_COMPLETED)
+                futs |= {executor.submit(fn, ext) for ext in islice(exts, len(done))}
+                for fut in done:
+                    src_alloc, alloc = fut.result()
+                    if not alloc:
+                        continue
+                    alloc.parent = ex
+                    ex.extents.append(alloc)
+                    self._runtime.insert(alloc, commit=True)
+                    copied += alloc.size
         
         time_e = time.time()
         
@@ -428,5 +536,12 @@ class Session(object):
         return self
 
     def __exit__(self, ex_ty, ex_val, tb):
+        self._io_pool.shutdown()
+        for sock in self._viz_sockets.values():
+            try:
+                sock.disconnect()
+            except Exception as e:
+                self.log.warn(e)
+        self._viz_sockets = {}
         if not self._external_rt:
             self._runtime.shutdown()
@@ -11,3 +11,5 @@ BLOCKSIZE = 262144
 COPIES = 1
 THREADS = 5
 TIMEOUT = 180
+BATCH_SIZE = 32
+BATCH_BYTES = 67108864
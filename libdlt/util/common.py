@@ -1,9 +1,38 @@
 import sys
 import argparse
 import logging
-import urllib
+from ssl import create_default_context
+from urllib.parse import quote
 import requests
 
+from libdlt.util.util import loads
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import h2
+    import httpx
+    USE_HTTPX = True
+except ImportError:
+    USE_HTTPX = False
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+TIMEOUT = 30
+_SESSIONS = {}
+
+# always ask for minimum set of fields needed
+EXNODE_FIELDS = "?fields=selfRef,name,mode,parent"
+_PARENT_Q     = "&parent.href=%s"
+_NAME_Q       = "&name=%s"
+_SCENE_Q      = "&mode=directory|metadata.scene=%s"
+_SCENE_REG_Q  = "&mode=directory|metadata.scene=reg=%s"
+_NAME_REG_Q   = "&mode=directory|name=reg=%s"
+
 # http://stackoverflow.com/questions/3173320/text-progress-bar-in-the-console/34325723#34325723
 def print_progress(iteration, total, prefix='', suffix='', decimals=1, bar_length=80, fill='='):
     """
@@ -33,18 +62,9 @@ class ExnodeRESTQuery:
         return self.url(self.parent)
         
     def url(self, parent=None):
-        rq = self.baseq
-        if parent:
-            rq += "&parent.href=" + parent
-        elif self.parent:
-            rq += "&parent.href=" + self.parent
-        if self.scenes:
-            rq += "&mode=directory|metadata.scene=" + self.scenes
-        if self.regex:
-            rq += "&mode=directory|metadata.scene=reg=" + urllib.quote(self.regex)
-        if self.filt:
-            rq += "&mode=directory|name=reg=" + urllib.quote(self.filt)
-        return self.ep + rq        
+        parent = parent or self.parent
+        rq = self.baseq + _PARENT_Q % parent if parent else self.baseq
+        return self.ep + rq + self.filtq
     
     def __init__(self, args):
         # selection criteria
@@ -56,22 +76,29 @@ class ExnodeRESTQuery:
         
         # set the endpoint
         self.ep = args.url + "/exnodes"
-        # always ask for minimum set of fields needed
-        self.baseq = "?fields=selfRef,name,mode"
+        self.baseq = EXNODE_FIELDS
+        # selection filters are fixed for the run, build them once
+        self.filtq = ""
+        if self.scenes:
+            self.filtq += _SCENE_Q % quote(self.scenes, safe=",")
+        if self.regex:
+            self.filtq += _SCENE_REG_Q % quote(self.regex)
+        if self.filt:
+            self.filtq += _NAME_REG_Q % quote(self.filt)
         
         # if user specified path, set a parent root
         if self.path:
             if not self.path.startswith("/"):
                 raise Exception("Paths must be absolute, beginning with forward slash")
             arr = self.path.split("/")
-            pquery = self.baseq + "&parent.href=null=&name="+arr[1]
+            pquery = self.baseq + _PARENT_Q % "null=" + _NAME_Q % quote(arr[1], safe="")
             res = unis_get(self.ep + pquery, args.ssl)
             if len(res) < 1:
                 raise Exception("Could not find top-level directory, path not found")
             else:
                 for d in arr[2:]:
                     parent = res[0]
-                    pquery = "%s&parent.href=%s&name=%s" % (self.baseq, parent["selfRef"], d)
+                    pquery = self.baseq + _PARENT_Q % parent["selfRef"] + _NAME_Q % quote(d, safe="")
                     res = unis_get(self.ep + pquery, args.ssl)
                     if len(res) < 1:
                         raise Exception("Path not found")
@@ -91,15 +118,15 @@ class ExnodePUBSUBQuery:
     def query(self):
         query = {'mode': 'file'}
         if self.scenes:
-            if not query.has_key('metadata.scene'):
+            if 'metadata.scene' not in query:
                 query['metadata.scene'] = {}
             query['metadata.scene']['in']= self.scenes.split(',')
         if self.regex:
-            if not query.has_key('metadata.scene'):
+            if 'metadata.scene' not in query:
                 query['metadata.scene'] = {}
             query['metadata.scene']['reg']=self.regex
         if self.filt:
-            if not query.has_key('name'):
+            if 'name' not in query:
                 query['name'] = {}
             query['name']['reg']=self.filt
         return query
@@ -112,19 +139,92 @@ class ExnodePUBSUBQuery:
         self.filt = args.filter
         self.ep = args.url + "/subscribe"
 
+def unis_session(ssl=None):
+    """
+    Return a keep-alive session shared by all UNIS queries using
+    the same certificate, so repeated queries skip the handshake.
+    With httpx installed this is an HTTP/2 client that multiplexes
+    concurrent queries over a single connection
+    """
+    if ssl not in _SESSIONS:
+        if USE_HTTPX:
+            verify = True
+            if ssl:
+                verify = create_default_context()
+                verify.load_cert_chain(ssl)
+            limits = httpx.Limits(max_connections=32, max_keepalive_connections=16)
+            transport = httpx.HTTPTransport(http2=True, retries=3, limits=limits, verify=verify)
+            sess = httpx.Client(transport=transport, timeout=TIMEOUT, follow_redirects=True)
+        else:
+            sess = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32,
+                                  max_retries=Retry(total=3, backoff_factor=0.2))
+            sess.mount("http://", adapter)
+            sess.mount("https://", adapter)
+            if ssl:
+                sess.cert = ssl
+        _SESSIONS[ssl] = sess
+    return _SESSIONS[ssl]
+
+def _request(url, ssl, stream=False):
+    sess = unis_session(ssl)
+    if USE_HTTPX:
+        r = sess.send(sess.build_request("GET", url), stream=stream)
+    else:
+        r = sess.get(url, timeout=TIMEOUT, stream=stream)
+    if not (r.status_code == 200 or r.status_code == 304):
+        try:
+            if USE_HTTPX:
+                r.read()
+            raise Exception("Got status %d: %s" % (r.status_code, r.text))
+        finally:
+            r.close()
+    return r
+
 def unis_get(url, ssl):
+    return loads(_request(url, ssl).content)
+
+def _iter_items(r):
     try:
-        if ssl:
-            r = requests.get(url, cert=ssl)
+        if ijson is not None:
+            items = ijson.sendable_list()
+            coro = ijson.items_coro(items, "item", use_float=True)
+            chunks = r.iter_bytes() if USE_HTTPX else r.iter_content(65536)
+            for chunk in chunks:
+                coro.send(chunk)
+                yield from items
+                del items[:]
+            coro.close()
+            yield from items
         else:
-            r = requests.get(url)
-        if not (r.status_code == 200 or r.status_code == 304):
-            raise Exception("Got status %d: %s" % (r.status_code, r.text))
-        js = r.json()
-        return js
-    except Exception as e:
-        raise e
-    
+            yield from loads(r.content)
+    finally:
+        r.close()
+
+class _Listing(object):
+    """
+    Iterable over a streamed listing, close() releases the connection
+    even if iteration never started
+    """
+    def __init__(self, r):
+        self._r = r
+        self._items = _iter_items(r)
+
+    def __iter__(self):
+        return self._items
+
+    def close(self):
+        self._items.close()
+        self._r.close()
+
+def unis_iter(url, ssl):
+    """
+    Like unis_get, but yields the resources of a listing as they are
+    parsed off the wire when ijson is installed, so large listings can
+    be processed before the whole response has arrived
+    """
+    return _Listing(_request(url, ssl, stream=ijson is not None))
+
 PARSER_TYPE_DOWNLOAD = 1
 PARSER_TYPE_PUBSUB   = 2
 
@@ -156,6 +256,8 @@ def parseArgs(desc="EODN-IDMS File Acquisition", ptype=PARSER_TYPE_DOWNLOAD):
                             help='Recursively get all subdirectory contents')
         parser.add_argument('-p', '--path', type=str,
                             help='eXnode path to download')
+        parser.add_argument('-P', '--parallel', type=int, default=4,
+                            help='Number of concurrent lors_download processes')
     elif ptype == PARSER_TYPE_PUBSUB:
         parser.add_argument('-H', '--url', type=str,
                             default="ws://dev.crest.iu.edu:8888", #"ws://unis.crest.iu.edu:8890",
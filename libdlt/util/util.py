@@ -7,6 +7,17 @@ Author: Giampaolo Rodola' <g.rodola [AT] gmail [DOT] com>
 License: MIT
 """
 
+import json
+
+# JSON codec shared by the UNIS clients, orjson is used when installed
+try:
+    import orjson
+    loads = orjson.loads
+    def dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    loads, dumps = json.loads, json.dumps
+
 # see: http://goo.gl/kTQMs
 SYMBOLS = {
     'customary'     : ('B', 'K', 'M', 'G', 'T', 'P', 'E', 'Z', 'Y'),
@@ -8,10 +8,11 @@ import signal
 import json
 import logging
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pprint
 
 from libdlt.util import common as common
-from libdlt.util.common import ExnodeRESTQuery,parseArgs,unis_get
+from libdlt.util.common import ExnodeRESTQuery,parseArgs,unis_iter
 
 def signal_handler(signal, frame):
     print('Exiting the program')
@@ -19,65 +20,94 @@ def signal_handler(signal, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 
-def download(count, exdict, viz=False, verbose=False):
-    cnt = 1
+# UNIS listings are network bound, sibling directories are fetched concurrently
+EXECUTOR = ThreadPoolExecutor(max_workers=16)
+# directories per parent.href query, keeps request URLs well under server limits
+PARENT_BATCH = 50
+
+def download(count, exdict, viz=False, verbose=False, parallel=1):
+    # only the exnode href varies between invocations
+    prefix = ['lors_download', '-t', '10', '-b', '5m']
+    suffix = ['-X', viz] if viz else []
+
+    def run(job):
+        cnt, path, x = job
+        name = x["name"]
+        try:
+            logging.info("[%d of %d] %s/%s" % (cnt, count, path, name))
+            args = prefix + ['-f', x["selfRef"]] + suffix
+            p = subprocess.Popen(args, cwd=path, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+            _, err = p.communicate()
+            if verbose:
+                print (err)
+            elif "ERROR" in err:
+                print (err)
+        except Exception as e:
+            logging.error("Failed lors_download for %s: %s " % (name, e))
+
+    jobs = []
     for path,xnds in exdict.items():
-        pwd = os.getcwd()
         try:
             if not os.path.exists(path):
                 os.makedirs(path)
-            os.chdir(path)
         except Exception as e:
             logging.error("Could not set output directory: %s" % e)
-            pass
-        
+            path = None
         for x in xnds:
-            try:
-                logging.info("[%d of %d] %s/%s" % (cnt, count, path, x["name"]))
-                href  = x["selfRef"]
-                name  = x["name"]                         
-                args = ['lors_download', '-t', '10', '-b', '5m', '-f', href]
-                if viz:
-                    args.append('-X')
-                    args.append(viz)
-                p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                out, err = p.communicate()
-                if verbose:
-                    print (err)
-                elif "ERROR" in err:
-                    print (err)
-                cnt += 1
-            except Exception as e:
-                logging.error("Failed lors_download for %s: %s " % (name, e))
-                
-        os.chdir(pwd)
+            jobs.append((len(jobs) + 1, path, x))
+
+    # downloads are independent, keep several lors_download processes in flight
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+        list(pool.map(run, jobs))
 
-def get_exdict(rq, parent=None, path=None, rec=False, ssl=False, exdict={}):
+def get_exdict(rq, parent=None, path=None, rec=False, ssl=False, exdict=None):
     cnt = 0
-    js  = []
-    if not path:
-        path = "."
-    url = rq.url(parent)
-    js = unis_get(url, ssl)
-    for j in js:
+    if exdict is None:
+        exdict = {}
+    # breadth-first walk, each level of directories is listed in parallel
+    # with sibling directories folded into shared parent.href queries
+    frontier = [(parent, path or ".")]
+    while frontier:
+        groups = [frontier[i:i+PARENT_BATCH] for i in range(0, len(frontier), PARENT_BATCH)]
+        def listing(g):
+            return unis_iter(rq.url(",".join(p for p, _ in g if p)), ssl)
+        if len(groups) == 1:
+            # a lone listing is parsed while its body streams in
+            listings = streams = [listing(groups[0])]
+        else:
+            # read sibling bodies in full on the workers so they download concurrently
+            listings, streams = EXECUTOR.map(lambda g: list(listing(g)), groups), []
         try:
-            if j["mode"] == "file":
-                logging.debug("Queue download: %s" % (path+"/"+j["name"]))
-                if path in exdict:
-                    exdict[path].append(j)
-                else:
-                    exdict[path] = [j]
-                cnt += 1
-            elif j["mode"] == "directory" and rec:
-                logging.debug("Recursing into: %s" % j["name"])
-                npath = path + "/" + j["name"]
-                c,ed = get_exdict(rq, j["selfRef"], npath, rec, ssl, exdict)
-                cnt += c
-            else:
-                logging.info("Skipping directory %s" % j["name"])
-        except Exception as e:
-            logging.error("Failed to process UNIS response: %s" % e)
-            sys.exit(1)
+            work = []
+            work_append = work.append
+            for group, js in zip(groups, listings):
+                paths = dict(group)
+                single = group[0][1] if len(group) == 1 else None
+                for j in js:
+                    try:
+                        path = single or paths[j["parent"]["href"]]
+                        mode, name = j["mode"], j["name"]
+                        if mode == "file":
+                            logging.debug("Queue download: %s/%s", path, name)
+                            files = exdict.get(path)
+                            if files is None:
+                                exdict[path] = [j]
+                            else:
+                                files.append(j)
+                            cnt += 1
+                        elif mode == "directory" and rec:
+                            logging.debug("Recursing into: %s", name)
+                            work_append((j["selfRef"], path + "/" + name))
+                        else:
+                            logging.info("Skipping directory %s" % name)
+                    except Exception as e:
+                        logging.error("Failed to process UNIS response: %s" % e)
+                        sys.exit(1)
+        finally:
+            for js in streams:
+                js.close()
+        frontier = work
 
     return (cnt,exdict)
 
@@ -96,13 +126,15 @@ def main ():
             logging.debug("Found %d files in %d directories" % (c, len(ed)))
         
         if (args.list):
-            print ("total: %d" % c)
+            out = ["total: %d\n" % c]
+            append = out.append
             for k,v in ed.items():
-                print (k+":")
+                append(k+":\n")
                 for n in v:
-                    print ("\t"+n["name"])
+                    append("\t"+n["name"]+"\n")
+            sys.stdout.write("".join(out))
         else:
-            download(c, ed, args.visualize, args.verbose)
+            download(c, ed, args.visualize, args.verbose, args.parallel)
             
     except Exception as e:
         logging.error("%s" % e)
@@ -12,6 +12,7 @@ import libdlt
 
 from libdlt.util import common as common
 from libdlt.util.common import ExnodePUBSUBQuery, parseArgs, print_progress
+from libdlt.util.util import loads, dumps
 
 SYS_PATH="/etc/periscope"
 USER_DEPOTS=os.path.join(SYS_PATH, "depots.conf")
@@ -35,12 +36,13 @@ class Listener(object):
         self._viz = viz
         self._verbose = verbose
         self._list = vlist
+        self._ws = None
         
     def on_message(self, ws, message):
         href = None
         name = None
         try:
-            js   = json.loads(message)
+            js   = loads(message)
             if not js["headers"]["action"] == "POST":
                 return
             else:
@@ -70,8 +72,6 @@ class Listener(object):
             try:
                 sess = libdlt.Session(self._unis, bs=block_size, depots=depots,
                                       **{"viz_url": self._viz})
-                sess = libdlt.Session(host, bs=block_size, depots=depots,
-                                                        **{"viz_url": self._viz})
                 xfer = sess.download
                 result = xfer(href, None, progress_cb=progress)
                 diff, res = result.time, result.exnode
@@ -84,24 +84,25 @@ class Listener(object):
     def on_error(self, ws, error):
         logging.warn("Websocket error - {exp}".format(exp = error))
     
-    def on_close(self, ws):
+    def on_close(self, ws, *args):
         logging.warn("Remote connection lost")
         
     def on_open(self, ws):
         logging.info("Connected to %s" % self._rq.url())
         logging.info("Adding query %s" % self._rq.query())
         query = { "query": self._rq.query(), "resourceType": self._rq.ctype }
-        ws.send(json.dumps(query))
+        ws.send(dumps(query))
         logging.info("Listening for EODN-IDMS eXnodes...")
         
     def start(self):
-        ws = websocket.WebSocketApp(self._rq.url(),
-                                    on_message = self.on_message,
-                                    on_error = self.on_error,
-                                    on_close = self.on_close)
-        self._ws = ws
-        ws.on_open = self.on_open
-        ws.run_forever()
+        # the app is reused across reconnects, pings detect dead links early
+        if self._ws is None:
+            self._ws = websocket.WebSocketApp(self._rq.url(),
+                                              on_message = self.on_message,
+                                              on_error = self.on_error,
+                                              on_close = self.on_close)
+            self._ws.on_open = self.on_open
+        self._ws.run_forever(ping_interval=30, ping_timeout=10)
         
 def main ():
     args = parseArgs(desc="EODN-IDMS Subscription Tool",
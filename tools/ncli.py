@@ -1,4 +1,4 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 
 """ A Cli app to browse UNIS , exnodes and Blipp """
 import os
@@ -11,9 +11,8 @@ import json
 import logging
 import requests
 from subprocess import Popen
-import urllib
 from functools import partial
-from urlparse import urlparse
+from urllib.parse import urlparse
 
 unislist = {
     "dev" : {
@@ -273,7 +272,7 @@ def cdp_cmd (arr) :
                 print (e)
             else :
                 try :
-                    parr = map((lambda x : x['id']),j)
+                    parr = [x['id'] for x in j]
                 except Exception as e:
                     print (e)
                 else :
@@ -371,8 +370,8 @@ def parse_args(s) :
     """ Check from commands map and use the args to run the command """
     tokens = s.split(" ")
     """ lower case everything and filter out empty """
-    tokens = map((lambda x : x.strip().lower()), tokens)
-    arr = filter((lambda x : True if x else False), tokens)
+    tokens = (x.strip().lower() for x in tokens)
+    arr = [x for x in tokens if x]
     runCommand(arr)
 
 def runCommand(arr):
@@ -387,7 +386,7 @@ def runCommand(arr):
 def main() :
     init_availabe_commands() ### Initialize availabe commands
     while 1:
-        parse_args(raw_input("> "))
+        parse_args(input("> "))
 
 if __name__ =="__main__" :
     main()